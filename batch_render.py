@@ -0,0 +1,155 @@
+from interp import EvalError, Io, Melody, Play, Value, Voices, configure_render_cache, current_io, emptyEnv, evalChecked, render_to_file, typecheck
+from parse_run import parse, genAST
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from dataclasses import dataclass, asdict, fields
+from pathlib import Path
+import argparse
+import io
+import json
+import os
+import time
+
+# Renders a directory of Cb programs to one WAV file each, spread over a pool of processes.
+# Every worker imports the parser, note table and render cache once and keeps them warm
+# for all the programs it is given. Programs whose WAV file already exists are skipped, so an
+# interrupted run can simply be started again.
+#
+#   python batch_render.py songs/ out/ --jobs 8
+
+#____________________________________________________________________________________________________________________________
+#
+# Workers
+#____________________________________________________________________________________________________________________________
+
+@dataclass
+class Result:
+    program: str
+    output: str
+    status: str             # "rendered", "skipped" or "failed"
+    seconds: float = 0.0
+    bytes: int = 0
+    error: str | None = None
+
+class CaptureIo(Io):
+    '''Collects shown melodies instead of playing them; there is nobody to answer read.'''
+
+    def __init__(self):
+        self.shown: list[Value] = []
+
+    def show(self, melody) -> None:
+        self.shown.append(melody)
+
+    def read(self, prompt: str) -> str:
+        raise EvalError("read operation is not available in batch rendering")
+
+
+def render_program(program: Path, output: Path) -> Result:
+    '''Runs one program and writes everything it shows (and its final play) to output, in order.'''
+    start = time.perf_counter()
+    capture = CaptureIo()
+    current_io.set(capture)
+    # Write under a temporary name so an interrupted render is never mistaken for a finished one
+    partial = output.with_name(output.stem + ".part.wav")
+
+    try:
+        # The evaluator reports its progress on stdout, which nobody is reading here
+        with redirect_stdout(io.StringIO()):
+            ast = genAST(parse(program.read_text()))
+            typecheck(ast)
+            match evalChecked(emptyEnv, ast):
+                case Play(m):
+                    capture.shown.append(m)
+
+        parts = [v for v in capture.shown if isinstance(v, (Melody, Voices))]
+        render_to_file(parts, partial)
+        partial.replace(output)
+
+    except Exception as e:
+        partial.unlink(missing_ok=True)
+        error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        return Result(str(program), str(output), "failed", time.perf_counter() - start, error=error)
+
+    return Result(str(program), str(output), "rendered", time.perf_counter() - start, output.stat().st_size)
+
+#____________________________________________________________________________________________________________________________
+#
+# Driver
+#____________________________________________________________________________________________________________________________
+
+def read_manifest(dst: Path) -> dict[str, Result]:
+    '''The entries of an earlier run's manifest, by program. Keys this version does not know
+    about are ignored, and a manifest that cannot be read counts as no manifest at all.'''
+    known = {f.name for f in fields(Result)}
+    try:
+        entries = json.loads((dst / "manifest.json").read_text())["programs"]
+        return {entry["program"]: Result(**{k: v for k, v in entry.items() if k in known}) for entry in entries}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def write_manifest(dst: Path, results: list[Result]) -> None:
+    manifest = {
+        "rendered": sum(r.status == "rendered" for r in results),
+        "skipped": sum(r.status == "skipped" for r in results),
+        "failed": sum(r.status == "failed" for r in results),
+        "programs": [asdict(r) for r in sorted(results, key=lambda r: r.program)],
+    }
+    # Replace the old manifest in one step, so an interrupted run always leaves a readable one
+    partial = dst / "manifest.part.json"
+    partial.write_text(json.dumps(manifest, indent=2))
+    partial.replace(dst / "manifest.json")
+
+
+def render_directory(src: Path, dst: Path, jobs: int | None = None, pattern: str = "*.cb",
+                     cache_dir: Path | None = None) -> list[Result]:
+    '''Renders every program in src matching pattern to dst/<name>.wav. dst/manifest.json is
+    rewritten after every program, and outputs skipped on a rerun keep their earlier entries.'''
+    dst.mkdir(parents=True, exist_ok=True)
+    previous = read_manifest(dst)
+    results: list[Result] = []
+    todo: list[tuple[Path, Path]] = []
+
+    for program in sorted(src.glob(pattern)):
+        output = dst / f"{program.stem}.wav"
+        if output.exists():
+            earlier = previous.get(str(program), Result(str(program), str(output), "skipped"))
+            results.append(Result(str(program), str(output), "skipped", earlier.seconds, output.stat().st_size))
+        else:
+            todo.append((program, output))
+
+    write_manifest(dst, results)
+
+    # Workers spill their render caches to cache_dir when one is given
+    initializer = configure_render_cache if cache_dir is not None else None
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=(None, cache_dir)) as pool:
+        futures = [pool.submit(render_program, program, output) for program, output in todo]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            write_manifest(dst, results)
+            print(f"[{done}/{len(todo)}] {result.status} {result.program} ({result.seconds:.2f}s)")
+
+    return results
+
+
+def main():
+    args = argparse.ArgumentParser(description="Render a directory of Cb programs to WAV files.")
+    args.add_argument("src", type=Path, help="directory of programs")
+    args.add_argument("dst", type=Path, help="directory for the WAV files and manifest.json")
+    args.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    args.add_argument("--pattern", default="*.cb", help="glob for program files (default *.cb)")
+    args.add_argument("--cache-dir", type=Path, help="directory for render cache spill files")
+    opts = args.parse_args()
+
+    results = render_directory(opts.src, opts.dst, opts.jobs, opts.pattern, opts.cache_dir)
+    failed = [r for r in results if r.status == "failed"]
+    for r in failed:
+        print(f"failed: {r.program}: {r.error}")
+
+    print(f"{len(results) - len(failed)} of {len(results)} programs rendered to {opts.dst}")
+
+
+if __name__ == "__main__":
+    main()
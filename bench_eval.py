@@ -0,0 +1,45 @@
+from interp import Add, App, If, Letfun, Lit, Lt, Name, Sub, emptyEnv, evalChecked, evalInEnv, typecheck
+import sys
+import time
+
+# Compares the dynamically checked evaluator with the type-checked fast path on
+# arithmetic-heavy recursion.
+#
+#   python bench_eval.py [n] [repeats]
+
+def fib(n: int):
+    '''letfun fib(n) = if n < 2 then n else fib(n - 1) + fib(n - 2) in fib(n) end'''
+    body = If(Lt(Name("n"), Lit(2)), Name("n"),
+              Add(App(Name("fib"), Sub(Name("n"), Lit(1))), App(Name("fib"), Sub(Name("n"), Lit(2)))))
+    return Letfun("fib", "n", body, App(Name("fib"), Lit(n)))
+
+
+def best_time(evaluate, program, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        evaluate(emptyEnv, program)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    program = fib(n)
+
+    start = time.perf_counter()
+    typecheck(program)
+    check = time.perf_counter() - start
+
+    dynamic = best_time(evalInEnv, program, repeats)
+    checked = best_time(evalChecked, program, repeats)
+
+    print(f"fib({n}), best of {repeats}")
+    print(f"  evalInEnv:   {dynamic:.3f}s")
+    print(f"  typecheck:   {check:.4f}s")
+    print(f"  evalChecked: {checked:.3f}s  ({dynamic / checked:.2f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,20 @@
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any
+from functools import cache
+from pathlib import Path
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from contextvars import ContextVar
+from typing import Any, Protocol
+import asyncio
+import hashlib
+import os
+import struct
+import tempfile
+import threading
 import numpy as np
 import sounddevice as sd
 
-type Expr = Add | Sub | Mul | Div | Neg | Lit | Let | Name | If | Or | And | Not | Eq | Lt | Assign | Read | Seq | Letfun | App | Show | Melody | Play | Append | Repeat | Chorus
+type Expr = Add | Sub | Mul | Div | Neg | Lit | Let | Name | If | Or | And | Not | Eq | Lt | Assign | Read | Seq | Letfun | App | Show | Melody | Play | Append | Repeat | Chorus | Layer
 type Literal = int | bool
 
 #____________________________________________________________________________________________________________________________
@@ -206,6 +217,32 @@ class Chorus:
     def __str__(self) -> str:
         return f"(chorus effect {self.melody})"
 
+@dataclass
+class Layer:
+    tracks: tuple[tuple[Expr, Expr], ...]  # Tuple of (melody, onset) pairs
+
+    def __str__(self) -> str:
+        track_strs = [f"{t}" if onset == Lit(0) else f"({t} @> {onset})" for t, onset in self.tracks]
+        return "(layer " + " ".join(track_strs) + ")"
+
+@dataclass
+class Voice:
+    melody: Melody
+    onset: int = 0  # In the same units as note durations
+
+    def __str__(self) -> str:
+        return f"{self.melody}" if self.onset == 0 else f"{self.melody} from {self.onset}"
+
+@dataclass
+class Voices:
+    voices: tuple[Voice, ...]  # Tracks that sound at the same time
+
+    def __str__(self) -> str:
+        return "{" + " | ".join(str(v) for v in self.voices) + "}"
+
+    def __iter__(self):
+        return iter(self.voices)
+
 #____________________________________________________________________________________________________________________________
 #
 # Environment & Compiler
@@ -214,7 +251,7 @@ class Chorus:
 type Binding[V] = tuple[str,V]  # A pair of name and value
 type Env[V] = tuple[Binding[V], ...] # An environment is a tuple of bindings
 
-type Value = int | bool | Melody | Closure
+type Value = int | bool | Melody | Voices | Closure
 @dataclass
 class Closure:
     param: str
@@ -246,9 +283,28 @@ def setLoc[V](loc: Loc[V], value: V) -> None:
 class EvalError(Exception):
     pass
 
+def typeName(v: Value) -> str:
+    '''Names the type of a value the way the type checker writes it, for error messages.'''
+    match v:
+        case bool():
+            return "bool"
+        case int():
+            return "int"
+        case Melody():
+            return "melody"
+        case Voices():
+            return "voices"
+        case Play():
+            return "play"
+        case Closure():
+            return "function"
+        case _:
+            return type(v).__name__
+
 
 def eval(e: Expr) -> Value :
-    return evalInEnv(emptyEnv, e)
+    typecheck(e)
+    return evalChecked(emptyEnv, e)
 
 def evalInEnv(env: Env[Value], e:Expr) -> Value:
     match e:
@@ -319,10 +375,10 @@ def evalInEnv(env: Env[Value], e:Expr) -> Value:
         case Assign(x,e):
             loc_x = lookupEnv(x, env)
             if loc_x is None:
-                raise EvalError(f"Cannot assign to unbound name {n}")
+                raise EvalError(f"Cannot assign to unbound name {x}")
             
-            if isinstance(getLoc(l), Closure):  # Prevents modifying function bindings
-                raise EvalError(f"Cannot assign to function name {n}")
+            if isinstance(getLoc(loc_x), Closure):  # Prevents modifying function bindings
+                raise EvalError(f"Cannot assign to function name {x}")
             
             expr = evalInEnv(env, e)
             setLoc(loc_x, expr)
@@ -331,7 +387,7 @@ def evalInEnv(env: Env[Value], e:Expr) -> Value:
         
         case Read():
             try:
-                user_input = input("Enter an integer: ")
+                user_input = current_io.get().read("Enter an integer: ")
                 return int(user_input)
             except ValueError:
                 raise EvalError("read operation failed: input is not a valid integer")
@@ -416,8 +472,8 @@ def evalInEnv(env: Env[Value], e:Expr) -> Value:
             v = evalInEnv(env, expr)
             
             print(f"showing {v}")
-            if isinstance(v, Melody) or (isinstance(v, list) and all(isinstance(mel, Melody) for mel in v)):
-                play_melody(v)
+            if isinstance(v, (Melody, Voices)):
+                current_io.get().show(v)
 
             return v
         
@@ -431,6 +487,8 @@ def evalInEnv(env: Env[Value], e:Expr) -> Value:
                     duration_value = duration.value  # Extract value from Lit
                 else:
                     duration_value = evalInEnv(env, duration)  # Evaluate if it's not a Lit
+                if not isinstance(duration_value, int) or isinstance(duration_value, bool):
+                    raise EvalError("melody durations must be integers")
                 evaluated_notes.append((pitch, duration_value))
             print(f"Evaluated melody: {evaluated_notes}")
             return Melody(tuple(evaluated_notes))
@@ -438,10 +496,10 @@ def evalInEnv(env: Env[Value], e:Expr) -> Value:
         case Play(m):
             melody = evalInEnv(env, m)
             
-            if isinstance(melody, Melody) or (isinstance(melody, list) and all(isinstance(mel, Melody) for mel in melody)):
+            if isinstance(melody, (Melody, Voices)):
                 return Play(melody)
             else:
-                raise EvalError(f"Play operation requires a Melody, got {type(melody)}")
+                raise EvalError(f"Play operation requires a Melody, got {typeName(melody)}")
 
         case Append(l, r):
             match (evalInEnv(env, l), evalInEnv(env, r)):
@@ -452,12 +510,12 @@ def evalInEnv(env: Env[Value], e:Expr) -> Value:
 
         case Repeat(count, melody):
             count_val = evalInEnv(env, count)
-            if not isinstance(count_val, int):
-                raise EvalError(f"Repeat count should be an integer, got {type(count_val)}")
+            if not isinstance(count_val, int) or isinstance(count_val, bool):
+                raise EvalError(f"Repeat count should be an integer, got {typeName(count_val)}")
 
             melody_val = evalInEnv(env, melody)
             if not isinstance(melody_val, Melody):
-                raise EvalError("Repeat operation requires a melody, got {type(melody_val)}")
+                raise EvalError(f"Repeat operation requires a melody, got {typeName(melody_val)}")
                 
             if count_val < 0:
                 raise EvalError("Repeat count cannot be negative")
@@ -468,17 +526,494 @@ def evalInEnv(env: Env[Value], e:Expr) -> Value:
             melody_val = evalInEnv(env, melody)
 
             if not isinstance(melody_val, Melody):
-                raise EvalError(f"Chorus requires a Melody, got {type(melody_val)}")
+                raise EvalError(f"Chorus requires a Melody, got {typeName(melody_val)}")
 
             original = melody_val.notes
-            lower = [(f"{pitch}-1", duration) for pitch, duration in original]
-            higher = [(f"{pitch}+1", duration) for pitch, duration in original]
+            lower = tuple((f"{pitch}-1", duration) for pitch, duration in original)
+            higher = tuple((f"{pitch}+1", duration) for pitch, duration in original)
 
-            chorus_effect = [Melody(original), Melody(lower), Melody(higher)]
+            chorus_effect = Voices((Voice(Melody(original)), Voice(Melody(lower)), Voice(Melody(higher))))
 
             return chorus_effect
 
+        case Layer(tracks):
+            voices = []
+            for track, onset in tracks:
+                onset_val = evalInEnv(env, onset)
+                if not isinstance(onset_val, int) or isinstance(onset_val, bool):
+                    raise EvalError(f"Layer onset should be an integer, got {typeName(onset_val)}")
+
+                if onset_val < 0:
+                    raise EvalError("Layer onset cannot be negative")
+
+                match evalInEnv(env, track):
+                    case Melody() as m:
+                        voices.append(Voice(m, onset_val))
+                    case Voices(vs):
+                        voices.extend(Voice(v.melody, v.onset + onset_val) for v in vs)
+                    case v:
+                        raise EvalError(f"Layer requires melodies, got {typeName(v)}")
+
+            return Voices(tuple(voices))
+
+
+#____________________________________________________________________________________________________________________________
+#
+# Type Checking
+#____________________________________________________________________________________________________________________________
+
+type Type = IntType | BoolType | MelodyType | VoicesType | PlayType | FunType | TypeVar
+
+# Checks that could not be decided yet because a type was still a variable, to be run again
+# on that type once the whole program has been checked
+type Pending = list[tuple[Callable[[Type, str, Pending], None], Type, str]]
+
+@dataclass(frozen=True)
+class IntType:
+    def __str__(self) -> str:
+        return "int"
+
+@dataclass(frozen=True)
+class BoolType:
+    def __str__(self) -> str:
+        return "bool"
+
+@dataclass(frozen=True)
+class MelodyType:
+    def __str__(self) -> str:
+        return "melody"
+
+@dataclass(frozen=True)
+class VoicesType:
+    def __str__(self) -> str:
+        return "voices"
+
+@dataclass(frozen=True)
+class PlayType:
+    def __str__(self) -> str:
+        return "play"
+
+@dataclass
+class FunType:
+    param: Type
+    result: Type
+
+    def __str__(self) -> str:
+        return f"({resolve(self.param)} -> {resolve(self.result)})"
+
+@dataclass(eq=False)
+class TypeVar:
+    ref: Type | None = None  # Set once the variable is unified with another type
+    reason: str | None = None  # Message of the first rule that constrained the variable
+
+    def __str__(self) -> str:
+        return "?" if self.ref is None else str(resolve(self))
+
+@dataclass
+class Scheme:
+    quantified: list[TypeVar]  # Replaced by fresh variables wherever the name is used
+    body: Type
+
+class TypeCheckError(EvalError):
+    pass
+
+
+def resolve(t: Type) -> Type:
+    while isinstance(t, TypeVar) and t.ref is not None:
+        t = t.ref
+    return t
+
+def because(t: Type, default: str) -> str:
+    '''The message of the rule that fixed t, which is where evaluation would fail on a value
+    of another type.'''
+    while isinstance(t, TypeVar):
+        if t.reason is not None:
+            return t.reason
+        t = t.ref
+    return default
+
+def describe(t: Type) -> str:
+    '''Names a type the way typeName names the values of that type.'''
+    return "function" if isinstance(resolve(t), FunType) else str(resolve(t))
+
+def freeVars(t: Type) -> list[TypeVar]:
+    match resolve(t):
+        case TypeVar() as v:
+            return [v]
+        case FunType(p, r):
+            return freeVars(p) + freeVars(r)
+        case _:
+            return []
+
+def generalize(env: Env[Type | Scheme], t: Type, pending: Pending) -> Scheme:
+    '''Quantifies the variables of t that no enclosing binding can still pin down. Variables
+    waiting on a pending check stay shared, so every use is held to that check.'''
+    bound = {id(v) for _, u, _ in pending for v in freeVars(u)}
+    for _, u in env:
+        if isinstance(u, Scheme):
+            bound.update(id(v) for v in freeVars(u.body) if v not in u.quantified)
+        else:
+            bound.update(id(v) for v in freeVars(u))
+
+    quantified = []
+    for v in freeVars(t):
+        if id(v) not in bound and v not in quantified:
+            quantified.append(v)
+    return Scheme(quantified, t)
+
+def instantiate(s: Scheme) -> Type:
+    fresh = {id(v): TypeVar() for v in s.quantified}
+
+    def copy(t: Type) -> Type:
+        # Parts without quantified variables are shared, so they keep their reasons
+        if not any(id(v) in fresh for v in freeVars(t)):
+            return t
+        match resolve(t):
+            case TypeVar() as v:
+                return fresh.get(id(v), v)
+            case FunType(p, r):
+                return FunType(copy(p), copy(r))
+            case other:
+                return other
+
+    return copy(s.body)
+
+def occurs(v: TypeVar, t: Type) -> bool:
+    match resolve(t):
+        case TypeVar() as w:
+            return w is v
+        case FunType(p, r):
+            return occurs(v, p) or occurs(v, r)
+        case _:
+            return False
+
+def unify(t1: Type, t2: Type, msg: str) -> None:
+    '''Makes t1 and t2 the same type, raising TypeCheckError(msg) if they cannot be. A {} in
+    msg is replaced by the type t1 turned out to have.'''
+    if not bind(t1, t2, msg):
+        raise TypeCheckError(msg.replace("{}", describe(t1)))
+
+def bind(t1: Type, t2: Type, msg: str) -> bool:
+    t1, t2 = resolve(t1), resolve(t2)
+    match (t1, t2):
+        case _ if t1 is t2:
+            return True
+        case (TypeVar(), _):
+            if occurs(t1, t2):
+                return False
+            t1.ref = t2
+            t1.reason = t1.reason or msg
+            return True
+        case (_, TypeVar()):
+            return bind(t2, t1, msg)
+        case (FunType(p1, r1), FunType(p2, r2)):
+            return bind(p1, p2, msg) and bind(r1, r2, msg)
+        case _:
+            return t1 == t2
+
+def requirePlayable(t: Type, msg: str, pending: Pending) -> None:
+    match resolve(t):
+        case MelodyType() | VoicesType():
+            return
+        case TypeVar() as v:
+            v.reason = v.reason or msg
+            pending.append((requirePlayable, t, msg))
+        case other:
+            raise TypeCheckError(msg.format(describe(other)))
+
+def requireNotFunction(t: Type, msg: str, pending: Pending) -> None:
+    match resolve(t):
+        case FunType():
+            raise TypeCheckError(msg)
+        case TypeVar():
+            pending.append((requireNotFunction, t, msg))
+
+
+def typecheck(e: Expr) -> Type:
+    '''Infers the type of a whole program, raising TypeCheckError (with the message evaluation
+    would have failed with) if it is ill-typed.'''
+    pending: Pending = []
+    t = typeInEnv(emptyEnv, e, pending)
+
+    for check, u, msg in pending:
+        check(u, msg, [])  # Still a variable here means no value ever reaches it
+
+    return resolve(t)
+
+def typeInEnv(env: Env[Type | Scheme], e: Expr, pending: Pending) -> Type:
+    match e:
+        # Arithmetic Types
+        # ______________________________________________
+        case Add(l, r) | Sub(l, r) | Mul(l, r) | Div(l, r):
+            msg = {Add: "addition", Sub: "subtraction", Mul: "multiplication", Div: "division"}[type(e)]
+            unify(typeInEnv(env, l, pending), IntType(), f"{msg} of non-integers")
+            unify(typeInEnv(env, r, pending), IntType(), f"{msg} of non-integers")
+            return IntType()
+
+        case Neg(s):
+            unify(typeInEnv(env, s, pending), IntType(), "negation of non-integer")
+            return IntType()
+
+        case Lt(l, r):
+            unify(typeInEnv(env, l, pending), IntType(), "< requires integer operands")
+            unify(typeInEnv(env, r, pending), IntType(), "< requires integer operands")
+            return BoolType()
+
+        # Variable Types
+        # ______________________________________________
+        case Lit(bool()):
+            return BoolType()
+
+        case Lit(int()):
+            return IntType()
+
+        case Let(n, d, i):
+            return typeInEnv(extendEnv(n, typeInEnv(env, d, pending), env), i, pending)
+
+        case Name(n):
+            t = lookupEnv(n, env)
+            if t is None:
+                raise TypeCheckError(f"unbound name {n}")
+            return instantiate(t) if isinstance(t, Scheme) else t
+
+        case Assign(x, e):
+            t = lookupEnv(x, env)
+            if t is None:
+                raise TypeCheckError(f"Cannot assign to unbound name {x}")
+
+            if isinstance(t, Scheme):
+                raise TypeCheckError(f"Cannot assign to function name {x}")
+            requireNotFunction(t, f"Cannot assign to function name {x}", pending)
+
+            unify(t, typeInEnv(env, e, pending), f"Cannot change the type of {x} by assignment")
+            return t
+
+        case Read():
+            return IntType()
+
+        # Boolean Types
+        # ______________________________________________
+        case If(c, t, e):
+            unify(typeInEnv(env, c, pending), BoolType(), "condition in if expression must be a boolean")
+            t_type = typeInEnv(env, t, pending)
+            unify(t_type, typeInEnv(env, e, pending), "branches of if expression must have the same type")
+            return t_type
 
+        case Or(l, r) | And(l, r):
+            msg = "or requires boolean operands" if isinstance(e, Or) else "and requires boolean operands"
+            unify(typeInEnv(env, l, pending), BoolType(), msg)
+            unify(typeInEnv(env, r, pending), BoolType(), msg)
+            return BoolType()
+
+        case Not(s):
+            unify(typeInEnv(env, s, pending), BoolType(), "not requires a boolean operand")
+            return BoolType()
+
+        case Eq(l, r):
+            unify(typeInEnv(env, l, pending), typeInEnv(env, r, pending), "== requires operands of the same type")
+            return BoolType()
+
+        # Function Types
+        # ______________________________________________
+        case Letfun(n, p, b, i):
+            # Recursive calls inside the body share one type; uses after "in" each get their own copy
+            f = FunType(TypeVar(), TypeVar())
+            bodyEnv = extendEnv(p, f.param, extendEnv(n, f, env))
+            unify(typeInEnv(bodyEnv, b, pending), f.result, f"body of {n} does not match its uses")
+            return typeInEnv(extendEnv(n, generalize(env, f, pending), env), i, pending)
+
+        case App(f, a):
+            f_type = typeInEnv(env, f, pending)
+            a_type = typeInEnv(env, a, pending)
+            match (resolve(f_type), resolve(a_type)):
+                case (FunType(p, _), arg) if not isinstance(arg, TypeVar):
+                    # Evaluation would fail at whatever fixed the parameter's type, so report that
+                    unify(a_type, p, because(p, f"argument of type {{}} does not match {f}"))
+                case (FunType() | TypeVar(), _):
+                    pass
+                case _:
+                    raise TypeCheckError("application of non-function")
+
+            # Only an argument whose type contains the function's own type can fail here
+            result = TypeVar()
+            unify(f_type, FunType(a_type, result), f"{f} cannot be applied to a function of its own type")
+            return result
+
+        case Seq(e1, e2):
+            typeInEnv(env, e1, pending)
+            return typeInEnv(env, e2, pending)
+
+        case Show(expr):
+            return typeInEnv(env, expr, pending)
+
+        # Domain Types
+        # ______________________________________________
+        case Melody(notes):
+            for _, duration in notes:
+                unify(typeInEnv(env, duration, pending), IntType(), "melody durations must be integers")
+            return MelodyType()
+
+        case Play(m):
+            requirePlayable(typeInEnv(env, m, pending), "Play operation requires a Melody, got {}", pending)
+            return PlayType()
+
+        case Append(l, r):
+            unify(typeInEnv(env, l, pending), MelodyType(), "append operation requires two melodies")
+            unify(typeInEnv(env, r, pending), MelodyType(), "append operation requires two melodies")
+            return MelodyType()
+
+        case Repeat(count, melody):
+            unify(typeInEnv(env, count, pending), IntType(), "Repeat count should be an integer, got {}")
+            unify(typeInEnv(env, melody, pending), MelodyType(), "Repeat operation requires a melody, got {}")
+            return MelodyType()
+
+        case Chorus(melody):
+            unify(typeInEnv(env, melody, pending), MelodyType(), "Chorus requires a Melody, got {}")
+            return VoicesType()
+
+        case Layer(tracks):
+            for track, onset in tracks:
+                unify(typeInEnv(env, onset, pending), IntType(), "Layer onset should be an integer, got {}")
+                requirePlayable(typeInEnv(env, track, pending), "Layer requires melodies, got {}", pending)
+            return VoicesType()
+
+        case _:
+            raise TypeCheckError(f"cannot type {e}")
+
+
+#____________________________________________________________________________________________________________________________
+#
+# Checked Evaluation
+#____________________________________________________________________________________________________________________________
+
+def evalChecked(env: Env[Value], e: Expr) -> Value:
+    '''Evaluates a program that passed typecheck. Operand types are already known to be right,
+    so only the checks that depend on values (division by zero, negative counts, input) remain.
+    The most frequent cases come first, since match tries them in order.'''
+    match e:
+        case Lit(i):
+            return i
+
+        case Name(n):
+            return getLoc(lookupEnv(n, env))
+
+        case App(f, a):
+            fun = evalChecked(env, f)
+            arg = evalChecked(env, a)
+            return evalChecked(extendEnv(fun.param, newLoc(arg), fun.env), fun.body)
+
+        case Add(l, r):
+            return evalChecked(env, l) + evalChecked(env, r)
+
+        case Sub(l, r):
+            return evalChecked(env, l) - evalChecked(env, r)
+
+        case Mul(l, r):
+            return evalChecked(env, l) * evalChecked(env, r)
+
+        case Div(l, r):
+            lv = evalChecked(env, l)
+            rv = evalChecked(env, r)
+            if rv == 0:
+                raise EvalError("division by zero")
+            return lv // rv
+
+        case Neg(s):
+            return -evalChecked(env, s)
+
+        case Lt(l, r):
+            return evalChecked(env, l) < evalChecked(env, r)
+
+        case Eq(l, r):
+            return evalChecked(env, l) == evalChecked(env, r)
+
+        case If(c, t, e):
+            return evalChecked(env, t) if evalChecked(env, c) else evalChecked(env, e)
+
+        case Or(l, r):
+            return evalChecked(env, l) or evalChecked(env, r)
+
+        case And(l, r):
+            return evalChecked(env, l) and evalChecked(env, r)
+
+        case Not(s):
+            return not evalChecked(env, s)
+
+        case Let(n, d, i):
+            return evalChecked(extendEnv(n, newLoc(evalChecked(env, d)), env), i)
+
+        case Assign(x, e):
+            v = evalChecked(env, e)
+            setLoc(lookupEnv(x, env), v)
+            return v
+
+        case Read():
+            try:
+                return int(current_io.get().read("Enter an integer: "))
+            except ValueError:
+                raise EvalError("read operation failed: input is not a valid integer")
+
+        case Letfun(n, p, b, i):
+            c = Closure(p, b, env)
+            c.env = extendEnv(n, newLoc(c), env)
+            return evalChecked(c.env, i)
+
+        case Seq(e1, e2):
+            evalChecked(env, e1)
+            return evalChecked(env, e2)
+
+        case Show(expr):
+            v = evalChecked(env, expr)
+
+            print(f"showing {v}")
+            if isinstance(v, (Melody, Voices)):
+                current_io.get().show(v)
+
+            return v
+
+        case Melody(notes):
+            evaluated_notes = tuple((pitch, evalChecked(env, duration)) for pitch, duration in notes)
+            print(f"Evaluated melody: {list(evaluated_notes)}")
+            return Melody(evaluated_notes)
+
+        case Play(m):
+            return Play(evalChecked(env, m))
+
+        case Append(l, r):
+            return Melody(evalChecked(env, l).notes + evalChecked(env, r).notes)
+
+        case Repeat(count, melody):
+            count_val = evalChecked(env, count)
+            melody_val = evalChecked(env, melody)
+            if count_val < 0:
+                raise EvalError("Repeat count cannot be negative")
+
+            return Melody(melody_val.notes * count_val)
+
+        case Chorus(melody):
+            original = evalChecked(env, melody).notes
+            lower = tuple((f"{pitch}-1", duration) for pitch, duration in original)
+            higher = tuple((f"{pitch}+1", duration) for pitch, duration in original)
+
+            return Voices((Voice(Melody(original)), Voice(Melody(lower)), Voice(Melody(higher))))
+
+        case Layer(tracks):
+            voices = []
+            for track, onset in tracks:
+                onset_val = evalChecked(env, onset)
+                if onset_val < 0:
+                    raise EvalError("Layer onset cannot be negative")
+
+                match evalChecked(env, track):
+                    case Melody() as m:
+                        voices.append(Voice(m, onset_val))
+                    case Voices(vs):
+                        voices.extend(Voice(v.melody, v.onset + onset_val) for v in vs)
+
+            return Voices(tuple(voices))
+
+
+@cache
 def note_to_freq(note: str) -> float:
     # We will define our base frequency as A4
     base_freq = 440.0  
@@ -508,7 +1043,25 @@ def note_to_freq(note: str) -> float:
     return freq
 
 
-def generate_sin_wave(freq: float, duration: float, sample_rate: int = 44100) -> np.ndarray:
+#____________________________________________________________________________________________________________________________
+#
+# Audio Rendering
+#____________________________________________________________________________________________________________________________
+
+@dataclass(frozen=True)
+class Envelope:
+    attack: float = 0.1
+    decay: float = 0.1
+    sustain: float = 0.6
+    release: float = 0.1
+
+defaultEnvelope = Envelope()
+
+
+# generate_sin_wave and adsr_envelope synthesize one whole note at a time and are no longer on any
+# playback path. Playback goes through the Mixer, or the allocation-free BlockRenderer, and both must
+# reproduce these functions sample for sample (see test_render.py and test_realtime.py).
+def generate_sin_wave(freq: float, duration: float, sample_rate: int = 44100, envelope: Envelope = defaultEnvelope) -> np.ndarray:
     num_samples = int(round(sample_rate * duration))
 
     if freq == 0.0:
@@ -519,7 +1072,7 @@ def generate_sin_wave(freq: float, duration: float, sample_rate: int = 44100) ->
     # Generates the sin wave based on the frequency provided
     sin_wave = np.sin(2 * np.pi * freq * t)
     # Creates an evelope around the wave to eliminate popping
-    envelope = adsr_envelope(sample_rate, num_samples)
+    envelope = adsr_envelope(sample_rate, num_samples, envelope.attack, envelope.decay, envelope.sustain, envelope.release)
 
     return sin_wave * envelope
 
@@ -545,64 +1098,487 @@ def adsr_envelope(sample_rate, num_samples, attack=0.1, decay=0.1, sustain=0.6,
     return envelope
 
 
-def play_melody(melody, sample_rate: int = 44100, bpm: int = 120):
-    
+def as_voices(melody) -> Voices:
+    '''Returns the voices that are mixed together to play a value (a single one for a Melody).'''
+    match melody:
+        case Melody():
+            return Voices((Voice(melody),))
+        case Voices():
+            return melody
+        case _:
+            raise ValueError(f"Invalid input to play_melody: {type(melody)}")
+
+
+def adsr_corners(sample_rate: int, num_samples: int, envelope: Envelope = defaultEnvelope) -> tuple[int, int, int, int]:
+    '''The samples where attack, decay and sustain end and where the release reaches zero, for a
+    note of num_samples. A note shorter than the envelope gets every stage shrunk in proportion,
+    so the corners never run past the end of the note or out of order.'''
+    attack_samples = int(round(sample_rate * envelope.attack))
+    decay_samples = int(round(sample_rate * envelope.decay))
+    release_samples = int(round(sample_rate * envelope.release))
+    last = max(0, num_samples - 1)
+
+    total = attack_samples + decay_samples + release_samples
+    if total > num_samples:
+        scale = num_samples / total
+        attack_end, decay_end = int(round(attack_samples * scale)), int(round((attack_samples + decay_samples) * scale))
+    else:
+        attack_end, decay_end = attack_samples, attack_samples + decay_samples
+    sustain_end = max(decay_end, num_samples - release_samples)
+
+    return min(attack_end, last), min(decay_end, last), min(sustain_end, last), last
+
+
+def adsr_segment(sample_rate: int, num_samples: int, offset: int, length: int, envelope: Envelope = defaultEnvelope) -> np.ndarray:
+    '''Samples offset .. offset+length of the envelope adsr_envelope builds for a note of num_samples.'''
+    corners = [0, *adsr_corners(sample_rate, num_samples, envelope)]
+    levels = [0.0, 1.0, envelope.sustain, envelope.sustain, 0.0]
+
+    return np.interp(np.arange(offset, offset + length), corners, levels)
+
+
+def note_segment(freq: float, num_samples: int, offset: int, length: int, sample_rate: int = 44100, envelope: Envelope = defaultEnvelope) -> np.ndarray:
+    '''Samples offset .. offset+length of the wave generate_sin_wave builds for a note of num_samples.'''
+    if freq == 0.0:
+        return np.zeros(length)
+
+    t = np.arange(offset, offset + length) / sample_rate
+    return np.sin(2 * np.pi * freq * t) * adsr_segment(sample_rate, num_samples, offset, length, envelope)
+
+
+@dataclass(frozen=True)
+class Event:
+    onset: int      # First sample
+    length: int     # Number of samples the note sounds for, release included
+    freq: float
+    envelope: Envelope = defaultEnvelope
+
+
+def timeline(melody, sample_rate: int = 44100, bpm: int = 120, envelope: Envelope = defaultEnvelope, legato: float = 0.0) -> list[Event]:
+    '''Turns a Melody (or Voices) into its note events, sorted by onset. Rests make no events.
+
+    Every note is held legato seconds longer than written, so its release overlaps the start
+    of the note after it.'''
     eighthDuration = 120 / (bpm * 2)
+    tail = int(round(sample_rate * legato))
 
-    # Checks and plays a single melody object 
-    if isinstance(melody, Melody):  
-        audio = np.array([])
-        for pitch, duration in melody.notes:
+    events = []
+    for voice in as_voices(melody):
+        start = int(round(sample_rate * voice.onset * eighthDuration))
+        for pitch, duration in voice.melody.notes:
+            num_samples = int(round(sample_rate * duration * eighthDuration))
             freq = note_to_freq(pitch)
-            duration *= eighthDuration
+            if freq != 0.0:
+                events.append(Event(start, num_samples + tail, freq, envelope))
+            start += num_samples
+
+    events.sort(key=lambda ev: ev.onset)
+    return events
+
+
+class Mixer:
+    '''Overlap-adds the note events of any number of voices into one output.
+
+    Events are taken in onset order and dropped once they have finished, so each output block
+    only touches the events that actually sound in it.'''
+
+    def __init__(self, voices: Voices, sample_rate: int = 44100, bpm: int = 120,
+                 envelope: Envelope = defaultEnvelope, legato: float = 0.0):
+        self.sample_rate = sample_rate
+        self.events = timeline(voices, sample_rate, bpm, envelope, legato)
+
+        eighthDuration = 120 / (bpm * 2)
+        voice_ends = []
+        for v in voices:
+            written = sum(int(round(sample_rate * duration * eighthDuration)) for _, duration in v.melody)
+            voice_ends.append(int(round(sample_rate * v.onset * eighthDuration)) + written)
+        self.length = max(voice_ends + [ev.onset + ev.length for ev in self.events], default=0)
+        # Sums voices and normalizes volume to avoid waves clipping!
+        self.gain = 1 / len(voice_ends) if voice_ends else 1.0
+
+    def add_event(self, ev: Event, out: np.ndarray, start: int) -> None:
+        '''Adds the part of ev that falls inside out, which holds samples start .. start+len(out).'''
+        lo = max(start, ev.onset)
+        hi = min(start + len(out), ev.onset + ev.length)
+        if lo < hi:
+            out[lo - start:hi - start] += note_segment(ev.freq, ev.length, lo - ev.onset, hi - lo, self.sample_rate, ev.envelope)
+
+    def blocks(self, block_size: int = 2**16) -> Iterator[np.ndarray]:
+        '''Yields the mix in consecutive blocks of block_size samples (the last one may be shorter).'''
+        active: list[Event] = []
+        upcoming = 0
+
+        for start in range(0, self.length, block_size):
+            end = min(start + block_size, self.length)
+            while upcoming < len(self.events) and self.events[upcoming].onset < end:
+                active.append(self.events[upcoming])
+                upcoming += 1
+
+            block = np.zeros(end - start)
+            for ev in active:
+                self.add_event(ev, block, start)
+
+            active = [ev for ev in active if ev.onset + ev.length > end]
+            block *= self.gain
+            yield block
+
+    def render(self) -> np.ndarray:
+        '''Renders the whole mix in one pass over the events.'''
+        audio = np.zeros(self.length)
+        for ev in self.events:
+            self.add_event(ev, audio, 0)
+
+        audio *= self.gain
+        return audio
 
-            wave = generate_sin_wave(freq, duration, sample_rate)
-            audio = np.append(audio, wave)
 
-        final_audio = audio  
+#____________________________________________________________________________________________________________________________
+#
+# Render Cache
+#____________________________________________________________________________________________________________________________
 
-    # Checks and plays a list of melodies (from Chorus)
-    elif isinstance(melody, list) and all(isinstance(m, Melody) for m in melody):  
-        audio_layers = []
+def render_key(melody, sample_rate: int, bpm: int, envelope: Envelope, legato: float = 0.0) -> str:
+    '''Content hash of a fully evaluated melody (or voices) together with its render parameters.'''
+    voices = tuple((v.onset, tuple(tuple(note) for note in v.melody.notes)) for v in as_voices(melody))
+    content = repr((voices, sample_rate, bpm, envelope, legato))
+    return hashlib.sha256(content.encode()).hexdigest()
 
-        for m in melody:
-            audio = np.array([])  
-            for pitch, duration in m.notes:
-                freq = note_to_freq(pitch)
-                duration *= eighthDuration
 
-                wave = generate_sin_wave(freq, duration, sample_rate)
-                audio = np.append(audio, wave)
-            
-            audio_layers.append(audio)
+class RenderCache:
+    '''LRU cache of finished audio buffers.
 
-        # Sums layers and normalizes volume to avoid waves clipping!
-        final_audio = sum(audio_layers) / len(audio_layers)
+    Keeps at most max_bytes of audio in memory. Buffers evicted from memory are spilled to
+    <key>.npy files in spill_dir (when given) and memory-mapped back in on later hits.'''
 
-    else:
-        raise ValueError(f"Invalid input to play_melody: {type(melody)}")
+    def __init__(self, max_bytes: int = 256 * 2**20, spill_dir: str | Path | None = None):
+        self.max_bytes = max_bytes
+        self.spill_dir = Path(spill_dir) if spill_dir is not None else None
+        self.entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.used_bytes = 0
+
+    def spill_path(self, key: str) -> Path | None:
+        return self.spill_dir / f"{key}.npy" if self.spill_dir is not None else None
+
+    def get(self, key: str) -> np.ndarray | None:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        path = self.spill_path(key)
+        if path is not None and path.exists():
+            return np.load(path, mmap_mode="r")
+
+        return None
+
+    def put(self, key: str, audio: np.ndarray) -> None:
+        # Cached buffers are shared between plays, so nobody may write to them
+        audio.setflags(write=False)
+
+        if key in self.entries:
+            self.used_bytes -= self.entries.pop(key).nbytes
+
+        if audio.nbytes > self.max_bytes:
+            self.spill(key, audio)
+            return
+
+        self.entries[key] = audio
+        self.used_bytes += audio.nbytes
+
+        while self.used_bytes > self.max_bytes:
+            old_key, old_audio = self.entries.popitem(last=False)
+            self.used_bytes -= old_audio.nbytes
+            self.spill(old_key, old_audio)
+
+    def spill(self, key: str, audio: np.ndarray) -> None:
+        path = self.spill_path(key)
+        if path is None or path.exists():
+            return
+        
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write under a temporary name of our own first, so a half-written file is never mapped
+        # and other processes spilling the same key into this directory don't collide with us
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{key}.", suffix=".tmp", delete=False) as tmp:
+            np.save(tmp, audio)
+        try:
+            os.replace(tmp.name, path)
+        except OSError:
+            # Someone else got there first with the same audio, which is just as good
+            Path(tmp.name).unlink(missing_ok=True)
+            if not path.exists():
+                raise
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.used_bytes = 0
+
+
+# CB_RENDER_CACHE_DIR turns on spilling for the shared cache without any code changes
+render_cache = RenderCache(spill_dir=os.environ.get("CB_RENDER_CACHE_DIR"))
+
+
+def configure_render_cache(max_bytes: int | None = None, spill_dir: str | Path | None = None) -> RenderCache:
+    '''Replaces the shared render cache, e.g. to give it a spill directory or a different budget.'''
+    global render_cache
+    render_cache = RenderCache(render_cache.max_bytes if max_bytes is None else max_bytes, spill_dir)
+    return render_cache
+
+
+def render_melody(melody, sample_rate: int = 44100, bpm: int = 120, envelope: Envelope = defaultEnvelope,
+                  legato: float = 0.0) -> np.ndarray:
+    '''Renders a Melody (or Voices) to audio, reusing cached renders of the same content.
+    legato holds every note that many seconds longer, so its release overlaps the next note.'''
+    voices = as_voices(melody)
+    key = render_key(voices, sample_rate, bpm, envelope, legato)
+
+    audio = render_cache.get(key)
+    if audio is not None:
+        return audio
+
+    audio = Mixer(voices, sample_rate, bpm, envelope, legato).render()
+
+    render_cache.put(key, audio)
+    return audio
+
+
+def play_melody(melody, sample_rate: int = 44100, bpm: int = 120, envelope: Envelope = defaultEnvelope, legato: float = 0.0):
+    final_audio = render_melody(melody, sample_rate, bpm, envelope, legato)
 
     # Play the resulting audio
     sd.play(final_audio, sample_rate)
     sd.wait()
 
+#____________________________________________________________________________________________________________________________
+#
+# Offline Rendering
+#____________________________________________________________________________________________________________________________
+
+def wav_header(num_samples: int, sample_rate: int) -> bytes:
+    '''Header of a mono 32-bit float WAV file holding num_samples samples.'''
+    data_bytes = num_samples * 4
+    fmt = struct.pack("<HHIIHHH", 3, 1, sample_rate, sample_rate * 4, 4, 32, 0)  # 3 = IEEE float
+    fact = struct.pack("<I", num_samples)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"fact" + struct.pack("<I", len(fact)) + fact
+
+    return b"RIFF" + struct.pack("<I", len(body) + 8 + data_bytes) + body + b"data" + struct.pack("<I", data_bytes)
+
+
+def render_to_file(melody, path: str | Path, sample_rate: int = 44100, bpm: int = 120,
+                   envelope: Envelope = defaultEnvelope, window: int = 2**16, legato: float = 0.0) -> Path:
+    '''Renders a Melody (or Voices), or a list of them played one after another, straight into
+    a file, window samples at a time.
+
+    Writes a float32 WAV file when path ends in .wav and raw little-endian float32 samples
+    otherwise. Each window is memory-mapped, filled by the mixer, flushed and released on its
+    own, so memory use does not grow with the length of the piece.'''
+    path = Path(path)
+    parts = melody if isinstance(melody, list) else [melody]
+    mixers = [Mixer(as_voices(part), sample_rate, bpm, envelope, legato) for part in parts]
+    total = sum(mixer.length for mixer in mixers)
+
+    header = wav_header(total, sample_rate) if path.suffix.lower() == ".wav" else b""
+    if header and total * 4 > 0xFFFFFFFF - len(header):
+        raise ValueError("render too long for a WAV file, use a raw output path instead")
+
+    with open(path, "wb") as f:
+        f.write(header)
+        f.truncate(len(header) + total * 4)
+
+    def part_blocks(part, mixer: Mixer) -> Iterator[np.ndarray]:
+        # Parts small enough to keep go through the render cache, so repeated ones are only
+        # synthesized once; long ones are streamed so they never have to fit in memory
+        if mixer.length * 8 <= render_cache.max_bytes // 16:
+            audio = render_melody(part, sample_rate, bpm, envelope, legato)
+            for start in range(0, len(audio), window):
+                yield audio[start:start + window]
+        else:
+            yield from mixer.blocks(window)
+
+    position = 0
+    for block in (block for part, mixer in zip(parts, mixers) for block in part_blocks(part, mixer)):
+        out = np.memmap(path, dtype="<f4", mode="r+", offset=len(header) + position * 4, shape=(len(block),))
+        out[:] = block
+        out.flush()
+        del out
+        position += len(block)
+
+    return path
+
+
+#____________________________________________________________________________________________________________________________
+#
+# Real-time Rendering
+#____________________________________________________________________________________________________________________________
+
+def adsr_pieces(ev: Event, sample_rate: int) -> list[tuple[int, int, float, float]]:
+    '''The envelope adsr_segment gives ev, as (first, end, slope, intercept) lines over note samples.'''
+    env = ev.envelope
+    attack_end, decay_end, sustain_end, last = adsr_corners(sample_rate, ev.length, env)
+    decay_slope = (env.sustain - 1) / max(1, decay_end - attack_end)
+    release_slope = -env.sustain / max(1, last - sustain_end)
+
+    return [
+        (0, attack_end, 1 / max(1, attack_end), 0.0),
+        (attack_end, decay_end, decay_slope, 1 - decay_slope * attack_end),
+        (decay_end, sustain_end, 0.0, env.sustain),
+        (sustain_end, ev.length, release_slope, env.sustain - release_slope * sustain_end),
+    ]
+
+
+class BlockRenderer:
+    '''Renders voices one block at a time into preallocated buffers, for playback from an audio callback.
+
+    After the first few blocks nothing is allocated: every wave and envelope is computed with
+    in-place ufuncs (out=) in scratch buffers sized for one block. render_block returns a view of
+    the renderer's own output buffer, which is overwritten by the next call.'''
+
+    def __init__(self, voices: Voices, sample_rate: int = 44100, bpm: int = 120,
+                 envelope: Envelope = defaultEnvelope, block_size: int = 512, legato: float = 0.0):
+        mixer = Mixer(voices, sample_rate, bpm, envelope, legato)
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.events = mixer.events
+        self.pieces = [adsr_pieces(ev, sample_rate) for ev in self.events]
+        self.length = mixer.length
+        self.gain = mixer.gain
+
+        # Scratch space, reused for every block
+        self.out = np.zeros(block_size)
+        self.wave = np.empty(block_size)
+        self.env = np.empty(block_size)
+        self.ramp = np.arange(block_size, dtype=np.float64)
+
+        self.position = 0
+        self.upcoming = 0
+        self.active: list[int] = []  # Indices of the events sounding in the current block
+        self.underruns = 0
+
+    @property
+    def done(self) -> bool:
+        return self.position >= self.length
+
+    def render_block(self, frames: int | None = None) -> np.ndarray:
+        '''Renders the next frames (at most block_size) samples; past the end they are silent.'''
+        frames = self.block_size if frames is None else frames
+        if frames > self.block_size:
+            raise ValueError(f"cannot render {frames} frames in blocks of {self.block_size}")
+        start = self.position
+        end = start + frames
+        out = self.out[:frames]
+        out.fill(0.0)
+
+        while self.upcoming < len(self.events) and self.events[self.upcoming].onset < end:
+            self.active.append(self.upcoming)
+            self.upcoming += 1
+
+        kept = 0
+        for i in self.active:
+            ev = self.events[i]
+            lo = max(start, ev.onset)
+            hi = min(end, ev.onset + ev.length)
+            if lo < hi:
+                self.add_segment(i, lo - ev.onset, out[lo - start:hi - start])
+            if ev.onset + ev.length > end:
+                self.active[kept] = i
+                kept += 1
+        del self.active[kept:]
+
+        out *= self.gain
+        self.position = end
+        return out
+
+    def add_segment(self, i: int, offset: int, out: np.ndarray) -> None:
+        '''Adds samples offset .. offset+len(out) of event i to out, without allocating.'''
+        n = len(out)
+        ev = self.events[i]
+        wave = self.wave[:n]
+        env = self.env[:n]
+
+        for first, end, slope, intercept in self.pieces[i]:
+            lo = max(first, offset) - offset
+            hi = min(end, offset + n) - offset
+            if lo < hi:
+                piece = env[lo:hi]
+                np.add(self.ramp[lo:hi], offset, out=piece)
+                piece *= slope
+                piece += intercept
+
+        np.add(self.ramp[:n], offset, out=wave)
+        wave *= 2 * np.pi * ev.freq / self.sample_rate
+        np.sin(wave, out=wave)
+        wave *= env
+        out += wave
+
+
+def play_realtime(melody, sample_rate: int = 44100, bpm: int = 120, envelope: Envelope = defaultEnvelope,
+                  block_size: int = 512, legato: float = 0.0) -> BlockRenderer:
+    '''Plays a Melody (or Voices) by rendering each block inside the audio callback as it is needed.
+    Returns the renderer, whose underruns counts the blocks the sound card ran dry on.'''
+    renderer = BlockRenderer(as_voices(melody), sample_rate, bpm, envelope, block_size, legato)
+    finished = threading.Event()
+
+    def callback(outdata, frames, time, status):
+        if status.output_underflow:
+            renderer.underruns += 1
+
+        np.copyto(outdata[:, 0], renderer.render_block(frames), casting="same_kind")
+        if renderer.done:
+            raise sd.CallbackStop
+
+    with sd.OutputStream(samplerate=sample_rate, blocksize=block_size, channels=1, dtype="float32",
+                         callback=callback, finished_callback=finished.set):
+        finished.wait()
+
+    return renderer
+
+
+#____________________________________________________________________________________________________________________________
+#
+# Input & Output
+#____________________________________________________________________________________________________________________________
+
+class Io:
+    '''Blocking playback and keyboard input, used by show, play and read in the plain interpreter.'''
+
+    def __init__(self, legato: float = 0.0, realtime: bool = False):
+        self.legato = legato
+        # Render in the audio callback block by block instead of rendering the whole melody first
+        self.realtime = realtime
+
+    def show(self, melody) -> None:
+        if not self.realtime:
+            play_melody(melody, legato=self.legato)
+            return
+
+        renderer = play_realtime(melody, legato=self.legato)
+        if renderer.underruns:
+            print(f"warning: {renderer.underruns} audio underruns")
+
+    def read(self, prompt: str) -> str:
+        return input(prompt)
+
+# The Io the evaluator talks to; run_async swaps in an AsyncIo for the evaluation thread
+current_io: ContextVar[Io] = ContextVar("current_io", default=Io())
+
+
 def run(e: Expr) -> None:
     print(f"running: {e}")
     try:
+        # Ill-typed programs are rejected before anything runs, so the checked evaluator can skip operand checks
+        typecheck(e)
         env = emptyEnv
-        match evalInEnv(env, e):
+        match evalChecked(env, e):
 
             case Play(m):
                 if isinstance(m, Melody):
                     print(f"Playing melody {m}")
 
-                elif isinstance(m, list) and all(isinstance(mel, Melody) for mel in m):
+                elif isinstance(m, Voices):
                     print("Layering these melodies:")
-                    for melody in m:
-                        print(f"Playing melody {melody}")
+                    for voice in m:
+                        print(f"Playing melody {voice}")
 
                 try:
-                    play_melody(m)
+                    current_io.get().show(m)
                     print("Melody played successfully.")
                 except ValueError as e:
                     # Handle errors (e.g., invalid note names in the melody)
@@ -614,6 +1590,9 @@ def run(e: Expr) -> None:
             case Melody(notes):
                 print(f"Computed melody: {notes}")
 
+            case Voices() as voices:
+                print(f"Computed voices: {voices}")
+
             case int(i):
                 print(f"result: {i}")
             
@@ -624,4 +1603,118 @@ def run(e: Expr) -> None:
                 print(f"result: {f}")
         
     except EvalError as err:
-        print(f"Evaluation error: {err}")
\ No newline at end of file
+        print(f"Evaluation error: {err}")
+
+
+#____________________________________________________________________________________________________________________________
+#
+# Asynchronous Execution
+#____________________________________________________________________________________________________________________________
+
+class AudioSink(Protocol):
+    async def play(self, audio: np.ndarray) -> None: ...
+
+
+class SoundDeviceSink:
+    '''Plays buffers back to back on one output stream, so consecutive shows are gapless.'''
+
+    def __init__(self, sample_rate: int = 44100):
+        self.stream = sd.OutputStream(samplerate=sample_rate, channels=1, dtype="float32")
+        self.stream.start()
+
+    async def play(self, audio: np.ndarray) -> None:
+        # write() only blocks until the buffer is queued, so run it off the event loop
+        await asyncio.to_thread(self.stream.write, np.asarray(audio, dtype=np.float32))
+
+    def close(self) -> None:
+        # stop() lets the queued audio finish playing
+        self.stream.stop()
+        self.stream.close()
+
+
+class RecordingSink:
+    '''Fake sink that records the buffers it is given instead of playing them.'''
+
+    def __init__(self):
+        self.played: list[np.ndarray] = []
+
+    async def play(self, audio: np.ndarray) -> None:
+        self.played.append(audio)
+        await asyncio.sleep(0)
+
+
+async def async_input(prompt: str) -> str:
+    return await asyncio.to_thread(input, prompt)
+
+
+def scripted_input(lines: Iterable[str]) -> Callable[[str], Awaitable[str]]:
+    '''Returns a reader that answers read operations from lines instead of the keyboard.'''
+    answers = iter(lines)
+
+    async def read(prompt: str) -> str:
+        try:
+            return next(answers)
+        except StopIteration:
+            raise EOFError("scripted input exhausted")
+
+    return read
+
+
+class AsyncIo(Io):
+    '''Io for evaluation on a worker thread: show renders on that thread and queues the audio on
+    the event loop, where a player task feeds it to the sink; read awaits the reader on the loop.'''
+
+    def __init__(self, sink: AudioSink, reader: Callable[[str], Awaitable[str]] = async_input,
+                 sample_rate: int = 44100, bpm: int = 120, legato: float = 0.0):
+        super().__init__(legato)
+        self.sink = sink
+        self.reader = reader
+        self.sample_rate = sample_rate
+        self.bpm = bpm
+        self.queue: asyncio.Queue[np.ndarray | None] = asyncio.Queue()
+
+    async def __aenter__(self) -> "AsyncIo":
+        self.loop = asyncio.get_running_loop()
+        self.player = asyncio.create_task(self.playback())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.queue.put_nowait(None)
+        await self.player
+
+    async def playback(self) -> None:
+        while (audio := await self.queue.get()) is not None:
+            await self.sink.play(audio)
+
+    def show(self, melody) -> None:
+        audio = render_melody(melody, self.sample_rate, self.bpm, legato=self.legato)
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, audio)
+
+    def read(self, prompt: str) -> str:
+        return asyncio.run_coroutine_threadsafe(self.reader(prompt), self.loop).result()
+
+    def call[R](self, f: Callable[..., R], *args) -> R:
+        current_io.set(self)
+        return f(*args)
+
+
+async def eval_async(e: Expr, sink: AudioSink, reader: Callable[[str], Awaitable[str]] = async_input,
+                     legato: float = 0.0) -> Value:
+    '''Evaluates e on a worker thread while shown melodies play on sink.'''
+    async with AsyncIo(sink, reader, legato=legato) as io:
+        return await asyncio.to_thread(io.call, eval, e)
+
+
+async def run_async(e: Expr, sink: AudioSink | None = None, reader: Callable[[str], Awaitable[str]] = async_input,
+                    legato: float = 0.0) -> None:
+    '''Like run, but playback is queued while evaluation continues and read waits asynchronously.'''
+    own_sink = sink is None
+    if sink is None:
+        sink = SoundDeviceSink()
+
+    try:
+        async with AsyncIo(sink, reader, legato=legato) as io:
+            await asyncio.to_thread(io.call, run, e)
+    finally:
+        if own_sink:
+            sink.close()
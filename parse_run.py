@@ -1,13 +1,16 @@
-from interp import Add, Sub, Mul, Div, Neg, Lit, Let, Name, If, Or, And, Not, Eq, Lt, Assign, Read, Letfun, App, Seq, Show, Play, Melody, Append, Chorus, Repeat, Expr, run
+from interp import Add, Sub, Mul, Div, Neg, Lit, Let, Name, If, Or, And, Not, Eq, Lt, Assign, Read, Letfun, App, Seq, Show, Play, Melody, Append, Chorus, Repeat, Layer, Expr, Io, current_io, run, run_async, configure_render_cache
 
 from lark import Lark, Token, ParseTree, Transformer
 from lark.exceptions import VisitError
+from functools import partial
 from pathlib import Path
+import asyncio
+import sys
 
-parser = Lark(Path('expr.lark').read_text(),start='expr', parser='earley',ambiguity='explicit')
+parser = Lark(Path(__file__).with_name('expr.lark').read_text(),start='expr', parser='earley',ambiguity='explicit')
 
 # A stricter parser which will fail if the grammar is ambiguous
-#parser = Lark(Path('expr.lark').read_text(),start='expr', parser='lalr',strict=True)
+#parser = Lark(Path(__file__).with_name('expr.lark').read_text(),start='expr', parser='lalr',strict=True)
 
 class ParseError(Exception): 
     pass
@@ -127,6 +130,17 @@ class ToExpr(Transformer[Token, Expr]):
     def chorus(self, args) -> Chorus:
         return Chorus(args[0])
 
+    def layer_track(self, args) -> tuple[Expr, Expr]:
+        # A track without "@> onset" starts with the layer
+        if len(args) == 1:
+            return (args[0], Lit(0))
+        if isinstance(args[1], Token):
+            return (args[0], Lit(int(args[1].value)))
+        return (args[0], args[1])
+
+    def layer(self, args) -> Layer:
+        return Layer(tuple(args))
+
     #Ambiguity Marker
     def _ambig(self, _) -> Expr:
         raise AmbiguousParse()
@@ -142,7 +156,11 @@ def genAST(t:ParseTree) -> Expr:
         else:
             raise e
         
-def parse_and_run(s: str):
+def async_runner(ast: Expr, legato: float = 0.0) -> None:
+    '''Runs ast with playback queued on the audio stream while evaluation continues.'''
+    asyncio.run(run_async(ast, legato=legato))
+
+def parse_and_run(s: str, runner=run):
     try:
         t = parse(s)
         print("raw:", t)    
@@ -150,7 +168,7 @@ def parse_and_run(s: str):
         print(t.pretty())
         ast = genAST(t)
         print("raw AST:", repr(ast))  # use repr() to avoid str() pretty-printing
-        run(ast)                      # pretty-prints and executes the AST
+        runner(ast)                   # pretty-prints and executes the AST
     except AmbiguousParse:
         print("ambiguous parse")                
     except ParseError as e:
@@ -198,6 +216,18 @@ def parse_and_run(s: str):
 def driver():
     print("Welcome to the Cb (C Flat) interpretter. Type 'exit' to quit.")
 
+    # --legato SECONDS holds every note longer so its release overlaps the next one
+    legato = float(sys.argv[sys.argv.index("--legato") + 1]) if "--legato" in sys.argv else 0.0
+    # --realtime renders each block in the audio callback and reports underruns
+    current_io.set(Io(legato, realtime="--realtime" in sys.argv))
+
+    # --async plays shown melodies in the background instead of blocking on each one
+    runner = partial(async_runner, legato=legato) if "--async" in sys.argv else run
+
+    # --cache-dir DIR spills rendered audio that no longer fits in memory to DIR
+    if "--cache-dir" in sys.argv:
+        configure_render_cache(spill_dir=sys.argv[sys.argv.index("--cache-dir") + 1])
+
     while True:
         try:
             uInput = input("> ")
@@ -206,7 +236,7 @@ def driver():
                 print("Shutting down...")
                 break
 
-            parse_and_run(uInput)
+            parse_and_run(uInput, runner)
 
         except KeyboardInterrupt:
                 print("Shutting down...")
@@ -215,4 +245,5 @@ def driver():
         except Exception:
             pass
 
-driver()
\ No newline at end of file
+if __name__ == "__main__":
+    driver()
@@ -0,0 +1,81 @@
+from interp import Add, Chorus, Lit, Melody, Play, Read, Seq, Show, RecordingSink, eval_async, render_melody, run_async, scripted_input
+import interp
+import asyncio
+import numpy as np
+import threading
+
+
+def song(*notes) -> Melody:
+    return Melody(tuple((pitch, Lit(duration)) for pitch, duration in notes))
+
+
+def test_shows_are_queued_in_order_while_read_waits_asynchronously():
+    # show [C1]; show (chorus [D1]); read + 1
+    program = Seq(Show(song(("C", 1))), Seq(Show(Chorus(song(("D", 1)))), Add(Read(), Lit(1))))
+    sink = RecordingSink()
+
+    result = asyncio.run(eval_async(program, sink, scripted_input(["4"])))
+
+    assert result == 5
+    assert len(sink.played) == 2
+    assert np.array_equal(sink.played[0], render_melody(Melody((("C", 1),))))
+    assert len(sink.played[1]) == len(sink.played[0])
+
+
+class HeldSink:
+    '''Fake sink that keeps playing the first buffer until release is set, like a long show.'''
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.played: list[np.ndarray] = []
+
+    async def play(self, audio: np.ndarray) -> None:
+        self.played.append(audio)
+        await self.release.wait()
+
+
+def test_evaluation_finishes_while_the_first_show_is_still_playing(monkeypatch):
+    program = Seq(Show(song(("C", 1))), Seq(Show(song(("D", 2))), Add(Read(), Lit(1))))
+    evaluated = threading.Event()
+    real_eval = interp.eval
+
+    def eval_and_signal(e):
+        try:
+            return real_eval(e)
+        finally:
+            evaluated.set()
+
+    monkeypatch.setattr(interp, "eval", eval_and_signal)
+
+    async def scenario():
+        sink = HeldSink()
+        task = asyncio.create_task(eval_async(program, sink, scripted_input(["4"])))
+        # eval_async's thread renders and queues both shows and returns, all while the sink is held
+        assert await asyncio.to_thread(evaluated.wait, 10)
+        assert len(sink.played) == 1
+        assert not task.done()
+
+        sink.release.set()
+        return await task, sink.played
+
+    result, played = asyncio.run(scenario())
+
+    assert result == 5
+    assert len(played) == 2
+    assert len(played[1]) == 2 * len(played[0])
+
+
+def test_run_async_plays_the_final_play_on_the_sink(capsys):
+    sink = RecordingSink()
+    asyncio.run(run_async(Play(song(("E", 2))), sink))
+
+    assert len(sink.played) == 1
+    assert "Melody played successfully." in capsys.readouterr().out
+
+
+def test_read_failure_is_reported_like_the_blocking_interpreter(capsys):
+    sink = RecordingSink()
+    asyncio.run(run_async(Add(Read(), Lit(1)), sink, scripted_input(["not a number"])))
+
+    assert "read operation failed: input is not a valid integer" in capsys.readouterr().out
+    assert sink.played == []
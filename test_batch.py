@@ -0,0 +1,62 @@
+from batch_render import read_manifest, render_directory
+from pathlib import Path
+import json
+import pytest
+
+
+@pytest.fixture
+def songs(tmp_path) -> Path:
+    src = tmp_path / "songs"
+    src.mkdir()
+    (src / "chorus.cb").write_text("<= ** melody(C2, D2) =>")
+    (src / "shown.cb").write_text("(show melody(E2)); 1")
+    (src / "ill_typed.cb").write_text("1 + true")
+    (src / "reads.cb").write_text("read + 1")
+    return src
+
+
+def manifest(dst: Path) -> dict:
+    return json.loads((dst / "manifest.json").read_text())
+
+
+def test_renders_each_program_and_records_it(songs, tmp_path):
+    dst = tmp_path / "out"
+    results = {Path(r.program).stem: r for r in render_directory(songs, dst, jobs=2)}
+
+    assert {name: r.status for name, r in results.items()} == {
+        "chorus": "rendered", "shown": "rendered", "ill_typed": "failed", "reads": "failed"}
+    assert sorted(p.name for p in dst.iterdir()) == ["chorus.wav", "manifest.json", "shown.wav"]
+    assert (dst / "chorus.wav").read_bytes()[:4] == b"RIFF"
+
+    m = manifest(dst)
+    assert (m["rendered"], m["skipped"], m["failed"]) == (2, 0, 2)
+    assert results["ill_typed"].error == "TypeCheckError: addition of non-integers"
+    assert results["reads"].error == "EvalError: read operation is not available in batch rendering"
+    assert results["chorus"].bytes == (dst / "chorus.wav").stat().st_size
+
+
+def test_rerun_skips_finished_outputs_and_keeps_their_timings(songs, tmp_path):
+    dst = tmp_path / "out"
+    render_directory(songs, dst, jobs=2)
+    first = {e["program"]: e for e in manifest(dst)["programs"]}
+
+    results = {Path(r.program).stem: r for r in render_directory(songs, dst, jobs=2)}
+
+    assert results["chorus"].status == results["shown"].status == "skipped"
+    # Failed programs have no output, so they are tried again
+    assert results["ill_typed"].status == "failed"
+    second = {e["program"]: e for e in manifest(dst)["programs"]}
+    for name in ("chorus", "shown"):
+        program = str(songs / f"{name}.cb")
+        assert second[program]["seconds"] == first[program]["seconds"] > 0
+    assert (manifest(dst)["rendered"], manifest(dst)["skipped"]) == (0, 2)
+
+
+def test_manifest_with_unknown_or_missing_keys_is_still_read(tmp_path):
+    entries = [{"program": "a.cb", "output": "a.wav", "status": "rendered", "seconds": 1.5, "cached": True},
+               {"program": "b.cb"}]
+    (tmp_path / "manifest.json").write_text(json.dumps({"programs": entries[:1]}))
+    assert read_manifest(tmp_path)["a.cb"].seconds == 1.5
+
+    (tmp_path / "manifest.json").write_text(json.dumps({"programs": entries}))
+    assert read_manifest(tmp_path) == {}
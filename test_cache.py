@@ -0,0 +1,66 @@
+from interp import RenderCache
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import multiprocessing
+import numpy as np
+
+audio = np.arange(2**20, dtype=float)
+
+
+def start_together(barrier) -> None:
+    global start
+    start = barrier
+
+def spill(spill_dir: Path) -> None:
+    start.wait()
+    RenderCache(max_bytes=0, spill_dir=spill_dir).put("samekey", audio.copy())
+
+
+def test_workers_spilling_the_same_key_all_succeed(tmp_path):
+    # Every worker of a batch render with --cache-dir spills into the same directory
+    with multiprocessing.Manager() as manager:
+        barrier = manager.Barrier(8)
+        with ProcessPoolExecutor(8, initializer=start_together, initargs=(barrier,)) as pool:
+            list(pool.map(spill, [tmp_path] * 8))
+
+    assert [p.name for p in tmp_path.iterdir()] == ["samekey.npy"]
+    assert np.array_equal(RenderCache(spill_dir=tmp_path).get("samekey"), audio)
+
+
+def buffer(value: float) -> np.ndarray:
+    return np.full(1000, value)
+
+
+def test_least_recently_used_buffer_is_evicted_first():
+    cache = RenderCache(max_bytes=2 * buffer(0).nbytes)
+    cache.put("a", buffer(1))
+    cache.put("b", buffer(2))
+    cache.get("a")
+    cache.put("c", buffer(3))
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+    assert cache.used_bytes == 2 * buffer(0).nbytes
+
+
+def test_evicted_buffers_come_back_from_disk_read_only(tmp_path):
+    cache = RenderCache(max_bytes=buffer(0).nbytes, spill_dir=tmp_path)
+    cache.put("a", buffer(1))
+    cache.put("b", buffer(2))
+
+    assert list(cache.entries) == ["b"]
+    assert cache.used_bytes <= cache.max_bytes
+    assert [p.name for p in tmp_path.iterdir()] == ["a.npy"]
+
+    spilled = cache.get("a")
+    assert isinstance(spilled, np.memmap)
+    assert not spilled.flags.writeable
+    assert np.array_equal(spilled, buffer(1))
+
+
+def test_buffers_over_budget_go_straight_to_disk(tmp_path):
+    cache = RenderCache(max_bytes=buffer(0).nbytes - 1, spill_dir=tmp_path)
+    cache.put("a", buffer(1))
+
+    assert cache.entries == {} and cache.used_bytes == 0
+    assert np.array_equal(cache.get("a"), buffer(1))
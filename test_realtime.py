@@ -0,0 +1,60 @@
+from interp import BlockRenderer, Envelope, Melody, Mixer, Voice, Voices
+import numpy as np
+import pytest
+import tracemalloc
+
+tune = Melody((("C", 2), ("D", 1), ("R", 1), ("E", 3), ("R", 2)))
+block_size = 512
+
+
+def crowd() -> Voices:
+    '''30 voices entering one eighth apart, so most blocks mix many overlapping notes.'''
+    return Voices(tuple(Voice(tune, k) for k in range(30)))
+
+
+def render_all(renderer: BlockRenderer) -> np.ndarray:
+    blocks = []
+    while not renderer.done:
+        blocks.append(renderer.render_block().copy())
+    return np.concatenate(blocks)
+
+
+@pytest.mark.parametrize("bpm, envelope", [
+    (120, Envelope()),
+    (300, Envelope()),                               # eighths shorter than the envelope
+    (120, Envelope(attack=0.3, decay=0.2, release=0.4)),
+])
+def test_blocks_match_the_mixer(bpm, envelope):
+    voices = crowd()
+    expected = Mixer(voices, bpm=bpm, envelope=envelope).render()
+    audio = render_all(BlockRenderer(voices, bpm=bpm, envelope=envelope, block_size=block_size))
+
+    assert np.abs(audio[:len(expected)] - expected).max() < 1e-12
+    assert not audio[len(expected):].any()
+
+
+def test_more_frames_than_a_block_are_refused():
+    renderer = BlockRenderer(crowd(), block_size=block_size)
+
+    with pytest.raises(ValueError, match="cannot render 513 frames in blocks of 512"):
+        renderer.render_block(block_size + 1)
+    assert renderer.position == 0
+
+
+def test_no_buffers_are_allocated_per_block_after_warm_up():
+    renderer = BlockRenderer(crowd(), block_size=block_size)
+    for _ in range(50):
+        renderer.render_block()
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for _ in range(500):
+            renderer.render_block()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # Any per-block array would be at least one block buffer
+    assert peak - baseline < block_size * 8
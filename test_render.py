@@ -0,0 +1,124 @@
+from interp import Envelope, Melody, Mixer, Voice, Voices, adsr_corners, adsr_segment, as_voices, defaultEnvelope, generate_sin_wave, note_to_freq, render_key, render_melody, render_to_file
+import interp
+import numpy as np
+import pytest
+import struct
+import tracemalloc
+
+# Rests in the middle and at the end, so the layout (not just the notes) is checked too
+tune = Melody((("C", 2), ("D", 1), ("R", 1), ("E", 3), ("R", 2)))
+lower = Melody(tuple((p if p == "R" else f"{p}-1", d) for p, d in tune.notes))
+
+
+def reference(melody: Melody, bpm: int = 120) -> np.ndarray:
+    '''Whole-note synthesis with generate_sin_wave/adsr_envelope, one note after another.'''
+    eighthDuration = 120 / (bpm * 2)
+    return np.concatenate([generate_sin_wave(note_to_freq(p), d * eighthDuration) for p, d in melody.notes])
+
+
+def test_mixer_matches_whole_note_synthesis():
+    audio = render_melody(tune)
+
+    assert audio.shape == reference(tune).shape
+    assert np.abs(audio - reference(tune)).max() < 1e-9
+
+
+def test_chorus_mix_is_the_average_of_its_voices():
+    expected = (reference(tune) + reference(lower)) / 2
+
+    assert np.abs(render_melody(Voices((Voice(tune), Voice(lower)))) - expected).max() < 1e-9
+
+
+def test_blocks_match_a_single_pass_render():
+    mixer = Mixer(Voices(tuple(Voice(tune, k) for k in range(8))), legato=0.2)
+
+    assert np.array_equal(np.concatenate(list(mixer.blocks(3000))), mixer.render())
+
+
+@pytest.fixture
+def streamed(monkeypatch) -> interp.RenderCache:
+    '''A render cache too small for any part, so render_to_file streams every part window by window.'''
+    cache = interp.RenderCache(max_bytes=0)
+    monkeypatch.setattr(interp, "render_cache", cache)
+    return cache
+
+
+def test_windowed_file_render_matches_in_memory_render(tmp_path, streamed):
+    voices = Voices((Voice(tune), Voice(lower, 3)))
+    path = render_to_file(voices, tmp_path / "song.raw", window=1000)
+
+    assert streamed.entries == {}
+    assert np.abs(np.fromfile(path, "<f4") - Mixer(voices).render()).max() < 1e-6
+
+
+def test_wav_header_describes_the_samples_that_follow(tmp_path, streamed):
+    path = render_to_file([tune, lower], tmp_path / "song.wav", window=1000)
+    expected = np.concatenate([Mixer(as_voices(tune)).render(), Mixer(as_voices(lower)).render()])
+    data = path.read_bytes()
+
+    riff, riff_size, wave = struct.unpack_from("<4sI4s", data, 0)
+    assert (riff, wave, riff_size) == (b"RIFF", b"WAVE", len(data) - 8)
+    assert struct.unpack_from("<4sIHHIIHH", data, 12) == (b"fmt ", 18, 3, 1, 44100, 44100 * 4, 4, 32)
+    assert struct.unpack_from("<4sII", data, 38) == (b"fact", 4, len(expected))
+    assert struct.unpack_from("<4sI", data, 50) == (b"data", len(expected) * 4)
+    assert np.abs(np.frombuffer(data, "<f4", offset=58) - expected).max() < 1e-6
+
+
+def test_file_render_memory_does_not_grow_with_length(tmp_path, streamed):
+    def peak(eighths: int) -> int:
+        tracemalloc.start()
+        render_to_file(Melody((("C", eighths), ("E", eighths))), tmp_path / "song.raw")
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    short, long = peak(100), peak(800)
+    # The long piece is 17.6M samples, 141 MB as float64; a window and its temporaries take a few MB
+    assert long < 8 * 2**20
+    assert long < short * 1.25
+
+
+def test_legato_lets_notes_ring_into_the_next():
+    plain = render_melody(tune)
+    legato = render_melody(tune, legato=0.2)
+    # D1 ends 1.5s in and is followed by a rest
+    rest = slice(int(44100 * 1.5), int(44100 * 1.7))
+
+    assert render_key(tune, 44100, 120, defaultEnvelope, 0.2) != render_key(tune, 44100, 120, defaultEnvelope)
+    assert len(legato) == len(plain)
+    assert not plain[rest].any()
+    assert np.abs(legato[rest]).max() > 0.01
+
+
+def test_repeated_parts_are_rendered_once_through_the_cache(tmp_path, monkeypatch):
+    cache = interp.RenderCache()
+    monkeypatch.setattr(interp, "render_cache", cache)
+
+    path = render_to_file([tune, lower, tune], tmp_path / "song.raw", window=1000)
+
+    assert len(cache.entries) == 2
+    expected = np.concatenate([render_melody(tune), render_melody(lower), render_melody(tune)])
+    assert np.abs(np.fromfile(path, "<f4") - expected).max() < 1e-6
+
+
+@pytest.mark.parametrize("num_samples, envelope", [
+    (4410, defaultEnvelope),                        # an eighth at bpm=300
+    (44100, Envelope(attack=0.5, decay=0.5, release=0.5)),
+    (3, defaultEnvelope),
+])
+def test_envelope_fits_notes_shorter_than_itself(num_samples, envelope):
+    corners = adsr_corners(44100, num_samples, envelope)
+    env = adsr_segment(44100, num_samples, 0, num_samples, envelope)
+    peak = int(np.argmax(env))
+
+    assert list(corners) == sorted(corners) and corners[-1] == num_samples - 1
+    assert env[0] == env[-1] == 0.0
+    assert np.all(np.diff(env[:peak + 1]) >= 0) and np.all(np.diff(env[peak:]) <= 0)
+    assert env.max() <= 1.0
+
+
+def test_short_notes_keep_their_length_and_level():
+    audio = render_melody(tune, bpm=300)
+
+    assert len(audio) == len(render_melody(tune)) * 120 // 300
+    assert np.abs(audio).max() <= 1.0
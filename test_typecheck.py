@@ -0,0 +1,80 @@
+from interp import (Add, App, Assign, Chorus, If, Layer, Letfun, Lit, Melody, Name, Not, Play, Repeat, Seq,
+                    EvalError, TypeCheckError, emptyEnv, eval, evalInEnv, typecheck, IntType)
+import pytest
+
+melody = Melody((("C", Lit(1)),))
+
+
+def ident(body):
+    return Letfun("id", "x", Name("x"), body)
+
+
+def test_functions_are_polymorphic_after_in():
+    program = ident(If(App(Name("id"), Lit(True)), App(Name("id"), Lit(1)), Lit(2)))
+
+    assert typecheck(program) == IntType()
+    assert eval(program) == 1
+
+
+def test_play_argument_stays_checked_at_every_use():
+    play = lambda body: Letfun("g", "x", Play(Name("x")), body)
+
+    with pytest.raises(TypeCheckError, match="Play operation requires a Melody, got int"):
+        typecheck(play(Seq(App(Name("g"), melody), App(Name("g"), Lit(4)))))
+
+
+def test_assigning_a_function_is_caught_once_the_type_is_known():
+    # letfun h(y) = y in letfun f(x) = (x := h; x(7)) in f(h) end end
+    f = Letfun("f", "x", Seq(Assign("x", Name("h")), App(Name("x"), Lit(7))), App(Name("f"), Name("h")))
+    program = Letfun("h", "y", Name("y"), f)
+
+    with pytest.raises(TypeCheckError, match="Cannot assign to function name x"):
+        typecheck(program)
+    with pytest.raises(EvalError, match="Cannot assign to function name x"):
+        evalInEnv(emptyEnv, program)
+
+
+@pytest.mark.parametrize("program", [
+    Add(Lit(1), Lit(True)),
+    If(Lit(1), Lit(2), Lit(3)),
+    Not(Lit(3)),
+    Repeat(Lit(2), Lit(1)),
+    Chorus(Lit(1)),
+    Layer(((Lit(1), Lit(0)),)),
+    Play(Lit(2)),
+    App(Lit(3), Lit(4)),
+    ident(Assign("id", Lit(1))),
+    Name("y"),
+    Repeat(Lit(True), melody),
+    Melody((("C", Lit(True)),)),
+    # A call with the wrong argument type fails where the parameter is first used
+    Letfun("f", "x", Add(Name("x"), Lit(1)), App(Name("f"), Lit(True))),
+    Letfun("f", "x", Repeat(Name("x"), melody), App(Name("f"), melody)),
+    Letfun("f", "x", Chorus(Name("x")), Seq(App(Name("f"), melody), App(Name("f"), Lit(2)))),
+])
+def test_static_and_dynamic_errors_agree(program):
+    with pytest.raises(TypeCheckError) as static:
+        typecheck(program)
+    with pytest.raises(EvalError) as dynamic:
+        evalInEnv(emptyEnv, program)
+
+    assert str(static.value) == str(dynamic.value)
+
+
+@pytest.mark.parametrize("program, static, dynamic", [
+    # Rejected when f is defined, before any call shows what x is
+    (Letfun("f", "x", App(Name("x"), Name("x")), App(Name("f"), Lit(3))),
+     "x cannot be applied to a function of its own type", "application of non-function"),
+    # The checker takes both branches into account, evaluation only the one it runs
+    (Letfun("f", "x", If(Lit(True), Lit(1), Add(Name("x"), Lit(1))), App(Name("f"), Lit(True))),
+     "addition of non-integers", None),
+])
+def test_known_differences_between_static_and_dynamic_errors(program, static, dynamic):
+    with pytest.raises(TypeCheckError, match=static):
+        typecheck(program)
+
+    if dynamic is None:
+        evalInEnv(emptyEnv, program)
+    else:
+        with pytest.raises(EvalError, match=dynamic):
+            evalInEnv(emptyEnv, program)
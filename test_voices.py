@@ -0,0 +1,27 @@
+from interp import Chorus, Layer, Lit, Melody, Mixer, Voice, Voices, EvalError, evalInEnv, emptyEnv
+import pytest
+
+
+def song(*notes) -> Melody:
+    return Melody(tuple((pitch, Lit(duration)) for pitch, duration in notes))
+
+
+def test_layer_places_tracks_at_their_onsets():
+    layer = Layer(((song(("C", 1), ("D", 2)), Lit(0)), (Chorus(song(("E", 1))), Lit(3))))
+
+    voices = evalInEnv(emptyEnv, layer)
+
+    assert [v.onset for v in voices] == [0, 3, 3, 3]
+    assert voices.voices[0] == Voice(Melody((("C", 1), ("D", 2))))
+
+
+def test_negative_onset_is_rejected():
+    with pytest.raises(EvalError, match="Layer onset cannot be negative"):
+        evalInEnv(emptyEnv, Layer(((song(("C", 1)), Lit(-1)),)))
+
+
+def test_mix_lasts_until_the_latest_voice_ends():
+    melody = Melody((("C", 2),))
+    late = Mixer(Voices((Voice(melody), Voice(melody, 4))))
+
+    assert late.length == Mixer(Voices((Voice(melody),))).length * 3